@@ -0,0 +1,22 @@
+import pytest
+import pandas as pd
+
+
+@pytest.fixture(scope='session')
+def sample_df():
+    """Sample DataFrame shared by all tests; clean_data mutates its input, so pass sample_df.copy()"""
+    return pd.DataFrame({
+        'dates': ['2024-01-01', '2024-01-02', '2024-01-01'],
+        'ids': ['1', '2', '1'],  # Note: duplicate id '1'
+        'names': ['artist one', 'artist two', 'artist one'],
+        'monthly_listeners': [1000000, 2000000, 1000000],
+        'popularity': [80, 90, 80],
+        'followers': [500000, 1000000, 500000],
+        'genres': ["['pop']", "['rock']", "['pop']"],
+        'first_release': ['2020', '2019', '2020'],
+        'last_release': ['2024', '2024', '2024'],
+        'num_releases': [5, 8, 5],
+        'num_tracks': [50, 80, 50],
+        'playlists_found': ['100', '200', '100'],
+        'feat_track_ids': ["['track1']", "['track2']", "['track1']"]
+    })
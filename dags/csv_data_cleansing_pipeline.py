@@ -10,6 +10,7 @@ from airflow.exceptions import AirflowSkipException
 import os
 import hashlib
 from docker.types import Mount
+from psycopg2.extras import execute_values
 
 # Default arguments
 default_args = {
@@ -33,6 +34,20 @@ dag = DAG(
     tags=['data-engineering', 'etl', 'csv'],
 )
 
+# Format of the duplicate records backup written by the data-cleaner ('parquet' or 'csv')
+BACKUP_FORMAT = 'parquet'
+
+# Batched insert helper
+def insert_batch(table, columns, rows):
+    """Insert rows into a postgres_data table in one round trip with execute_values"""
+    conn = PostgresHook(postgres_conn_id='postgres_data').get_conn()
+    try:
+        with conn.cursor() as cursor:
+            execute_values(cursor, f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s", rows)
+        conn.commit()
+    finally:
+        conn.close()
+
 # Task 1: Check source file
 check_source_file = FileSensor(
     task_id='check_source_file',
@@ -40,7 +55,7 @@ check_source_file = FileSensor(
     fs_conn_id='fs_default',
     poke_interval=30,
     timeout=600,
-    mode='poke',
+    mode='reschedule',  # release the worker slot between pokes
     dag=dag,
 )
 
@@ -49,6 +64,7 @@ validate_db = PostgresOperator(
     task_id='validate_database',
     postgres_conn_id='postgres_default',
     sql='SELECT version();',
+    pool='postgres_pool',
     dag=dag,
 )
 
@@ -77,37 +93,46 @@ backup_source = BashOperator(
 # Task 4: Check file changes
 def check_file_changes(**context):
     filepath = '/opt/airflow/source/scrap.csv'
-    # Compute MD5 hash of the file
     try:
-        with open(filepath, 'rb') as f:
-            content = f.read()
-            current_hash = hashlib.md5(content).hexdigest()
-            print(f"Computed hash for {filepath}: {current_hash}")
+        file_stat = os.stat(filepath)
     except FileNotFoundError:
         raise FileNotFoundError(f"Source file not found: {filepath}")
+    mtime_ns, size_bytes = file_stat.st_mtime_ns, file_stat.st_size
 
     postgres_hook = PostgresHook(postgres_conn_id='postgres_data')
     
-    # Create table if it doesn't exist
-    postgres_hook.run("""
-        CREATE TABLE IF NOT EXISTS file_processing_log (
-            id SERIAL PRIMARY KEY,
-            file_hash VARCHAR(32) UNIQUE,
-            file_path VARCHAR(500),
-            processing_status VARCHAR(50) DEFAULT 'processed',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-    """)
+    # Skip hashing entirely when the file stat matches a previously processed file
+    result = postgres_hook.get_first("""
+        SELECT file_hash FROM file_processing_log
+        WHERE file_path = %s AND mtime_ns = %s AND size_bytes = %s
+        ORDER BY id DESC LIMIT 1
+    """, parameters=(filepath, mtime_ns, size_bytes))
+    if result:
+        print(f"File {filepath} unchanged since last run (hash {result[0]}), skipping...")
+        raise AirflowSkipException(f"File already processed with hash {result[0]}")
+
+    # Compute MD5 hash of the file, streamed in 1 MiB chunks to keep memory flat
+    file_hash = hashlib.md5()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            file_hash.update(chunk)
+    current_hash = file_hash.hexdigest()
+    print(f"Computed hash for {filepath}: {current_hash}")
     
     # Check if file was already processed
     result = postgres_hook.get_first("SELECT file_hash FROM file_processing_log WHERE file_hash = %s", (current_hash,))
     if result:
+        # Same content with a new stat (e.g. touched or re-copied): remember the new stat
+        postgres_hook.run("""
+            UPDATE file_processing_log SET file_path = %s, mtime_ns = %s, size_bytes = %s
+            WHERE file_hash = %s
+        """, parameters=(filepath, mtime_ns, size_bytes, current_hash))
         print(f"File with hash {current_hash} already processed, skipping...")
         raise AirflowSkipException(f"File already processed with hash {current_hash}")
     
     # Insert new hash with explicit parameters
-    insert_query = "INSERT INTO file_processing_log (file_hash) VALUES (%s)"
-    params = (current_hash,)  # Explicit tuple for parameters
+    insert_query = "INSERT INTO file_processing_log (file_hash, file_path, mtime_ns, size_bytes) VALUES (%s, %s, %s, %s)"
+    params = (current_hash, filepath, mtime_ns, size_bytes)  # Explicit tuple for parameters
     print(f"Executing INSERT with query: {insert_query} and params: {params}")
     postgres_hook.run(insert_query, parameters=params)
     
@@ -117,6 +142,7 @@ def check_file_changes(**context):
 check_file_hash = PythonOperator(
     task_id='check_file_changes',
     python_callable=check_file_changes,
+    pool='postgres_pool',
     dag=dag,
 )
 
@@ -129,13 +155,14 @@ run_data_cleansing = DockerOperator(
     auto_remove=True,
     command=["python", "/app/main.py"],
     environment={
-        'DB_HOST': 'postgres',
-        'DB_PORT': '5432',
+        'DB_HOST': 'pgbouncer',
+        'DB_PORT': '6432',
         'DB_NAME': 'data_cleansing',
         'DB_USER': 'postgres',
         'DB_PASSWORD': 'password',
         'EXECUTION_DATE': '{{ ds }}',
         'EXECUTION_DATE_NODASH': '{{ ts_nodash }}',
+        'BACKUP_FORMAT': BACKUP_FORMAT,
     },
     mounts=[
         Mount(source='/d/Document work/EDTS/edts-de-technical-test-v4-data-cleansing-container-senior-level-question/source', target='/source', type='bind', read_only=True),
@@ -148,26 +175,16 @@ run_data_cleansing = DockerOperator(
 )
 
 # Error handling callback
-def handle_processing_errors(**context):
+def handle_processing_errors(context):
     task_instance = context['task_instance']
     dag_run = context['dag_run']
     exception = context.get('exception', 'Unknown error')
-    postgres_hook = PostgresHook(postgres_conn_id='postgres_data')
-    postgres_hook.run("""
-        CREATE TABLE IF NOT EXISTS error_log (
-            id SERIAL PRIMARY KEY,
-            dag_id VARCHAR(255),
-            execution_date TIMESTAMP,
-            task_id VARCHAR(255),
-            error_message TEXT,
-            log_url TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-    """)
-    postgres_hook.run("""
-        INSERT INTO error_log (dag_id, execution_date, task_id, error_message)
-        VALUES (%s, %s, %s, %s)
-    """, (dag_run.dag_id, dag_run.execution_date, task_instance.task_id, str(exception)))
+    # error_log is created by the init_schema DAG
+    insert_batch(
+        'error_log',
+        ['dag_id', 'execution_date', 'task_id', 'error_message'],
+        [(dag_run.dag_id, dag_run.execution_date, task_instance.task_id, str(exception))],
+    )
 
 run_data_cleansing.on_failure_callback = handle_processing_errors
 
@@ -175,9 +192,15 @@ run_data_cleansing.on_failure_callback = handle_processing_errors
 def validate_output_files(**context):
     timestamp = context['ts_nodash']
     json_file = f'/opt/airflow/target/data_{timestamp}.json'
-    csv_file = f'/opt/airflow/target/data_reject_{timestamp}.csv'
-    if not (os.path.exists(json_file) and os.path.exists(csv_file)):
-        raise FileNotFoundError(f"Missing output files: {json_file} or {csv_file}")
+    reject_file = f'/opt/airflow/target/data_reject_{timestamp}.{BACKUP_FORMAT}'
+    try:
+        json_stat = os.stat(json_file)
+        reject_stat = os.stat(reject_file)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Missing output files: {json_file} or {reject_file}")
+    # A zero-byte file means the cleanser crashed mid-write
+    if json_stat.st_size == 0 or reject_stat.st_size == 0:
+        raise ValueError(f"Empty output files: {json_file} ({json_stat.st_size} bytes), {reject_file} ({reject_stat.st_size} bytes)")
     return "Output files validated"
 
 validate_outputs = PythonOperator(
@@ -189,98 +212,38 @@ validate_outputs = PythonOperator(
 # Task 7: Data quality check
 def perform_data_quality_checks(**context):
     postgres_hook = PostgresHook(postgres_conn_id='postgres_data')
-    postgres_hook.run("""
-        CREATE TABLE IF NOT EXISTS data (
-            dates DATE,
-            ids VARCHAR(255) PRIMARY KEY,
-            names VARCHAR(255),
-            monthly_listeners BIGINT,
-            popularity INTEGER,
-            followers BIGINT,
-            genres TEXT,
-            first_release VARCHAR(4),
-            last_release VARCHAR(4),
-            num_releases INTEGER,
-            num_tracks INTEGER,
-            playlists_found VARCHAR(255),
-            feat_track_ids TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        CREATE TABLE IF NOT EXISTS data_reject (
-            id SERIAL PRIMARY KEY,
-            dates DATE,
-            ids VARCHAR(255),
-            names VARCHAR(255),
-            monthly_listeners BIGINT,
-            popularity INTEGER,
-            followers BIGINT,
-            genres TEXT,
-            first_release VARCHAR(4),
-            last_release VARCHAR(4),
-            num_releases INTEGER,
-            num_tracks INTEGER,
-            playlists_found VARCHAR(255),
-            feat_track_ids TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-    """)
-    clean_count = postgres_hook.get_first("SELECT COUNT(*) FROM data")[0]
-    reject_count = postgres_hook.get_first("SELECT COUNT(*) FROM data_reject")[0]
+    clean_count, reject_count = postgres_hook.get_first(
+        "SELECT (SELECT COUNT(*) FROM data), (SELECT COUNT(*) FROM data_reject)"
+    )
     if clean_count + reject_count == 0:
         raise ValueError("No data processed")
-    return f"Clean: {clean_count}, Reject: {reject_count}"
+    return {'clean': clean_count, 'reject': reject_count}
 
 data_quality_check = PythonOperator(
     task_id='data_quality_check',
     python_callable=perform_data_quality_checks,
+    pool='postgres_pool',
     dag=dag,
 )
 
 # Task 8: Collect metrics
 def collect_pipeline_metrics(**context):
-    postgres_hook = PostgresHook(postgres_conn_id='postgres_data')
-    postgres_hook.run("""
-        CREATE TABLE IF NOT EXISTS pipeline_metrics (
-            id SERIAL PRIMARY KEY,
-            execution_date DATE,
-            total_records INTEGER,
-            clean_records INTEGER,
-            rejected_records INTEGER,
-            processing_time FLOAT,
-            file_size BIGINT,
-            memory_usage FLOAT,
-            success_rate FLOAT,
-            dag_run_id VARCHAR(255),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-    """)
-    quality_results = context['task_instance'].xcom_pull(task_ids='data_quality_check')
-    if not quality_results or "No data processed" in quality_results:
-        print("No valid data quality results available, inserting default values")
-        clean = 0
-        reject = 0
-    else:
-        try:
-            parts = quality_results.split(', ')
-            clean_part = parts[0].split(': ')[1]
-            reject_part = parts[1].split(': ')[1]
-            clean = int(clean_part)
-            reject = int(reject_part)
-        except (ValueError, AttributeError, IndexError) as e:
-            print(f"Failed to parse quality results '{quality_results}': {str(e)}")
-            clean = 0
-            reject = 0
+    quality_results = context['task_instance'].xcom_pull(task_ids='data_quality_check') or {}
+    clean = int(quality_results.get('clean', 0))
+    reject = int(quality_results.get('reject', 0))
     
     params = (context['ds'], clean + reject, clean, reject, context['dag_run'].run_id)
     print(f"Executing INSERT with parameters: {params}")
-    postgres_hook.run("""
-        INSERT INTO pipeline_metrics (execution_date, total_records, clean_records, rejected_records, dag_run_id)
-        VALUES (%s, %s, %s, %s, %s)
-    """, parameters=params)
+    insert_batch(
+        'pipeline_metrics',
+        ['execution_date', 'total_records', 'clean_records', 'rejected_records', 'dag_run_id'],
+        [params],
+    )
 
 metrics_collection = PythonOperator(
     task_id='collect_metrics',
     python_callable=collect_pipeline_metrics,
+    pool='postgres_pool',
     dag=dag,
 )
 
@@ -290,8 +253,11 @@ archive_files = BashOperator(
     bash_command='''
     timestamp={{ ts_nodash }}
     mkdir -p /opt/airflow/archive/$timestamp
-    cp /opt/airflow/target/data_$timestamp.json /opt/airflow/archive/$timestamp/ 2>/dev/null || true
-    cp /opt/airflow/target/data_reject_$timestamp.csv /opt/airflow/archive/$timestamp/ 2>/dev/null || true
+    # Hardlink (no data copy) when target and archive share a filesystem, otherwise copy
+    for file in data_$timestamp.json data_reject_$timestamp.csv data_reject_$timestamp.parquet; do
+        ln -f /opt/airflow/target/$file /opt/airflow/archive/$timestamp/ 2>/dev/null || \
+            cp /opt/airflow/target/$file /opt/airflow/archive/$timestamp/ 2>/dev/null || true
+    done
     echo "Files archived for $timestamp"
     ''',
     dag=dag,
@@ -304,10 +270,11 @@ cleanup_old_files = BashOperator(
     find /opt/airflow/archive -type d -mtime +7 -exec rm -rf {} + 2>/dev/null || true
     find /opt/airflow/target -name "*.json" -mtime +7 -delete 2>/dev/null || true
     find /opt/airflow/target -name "*.csv" -mtime +7 -delete 2>/dev/null || true
+    find /opt/airflow/target -name "*.parquet" -mtime +7 -delete 2>/dev/null || true
     ''',
     dag=dag,
 )
 
 # Task Dependencies
-check_source_file >> validate_db >> backup_source >> check_file_hash >> run_data_cleansing
+check_source_file >> [validate_db, backup_source] >> check_file_hash >> run_data_cleansing
 run_data_cleansing >> [validate_outputs, data_quality_check] >> metrics_collection >> archive_files >> cleanup_old_files
\ No newline at end of file
@@ -0,0 +1,31 @@
+from datetime import datetime
+from airflow import DAG
+from airflow.providers.postgres.operators.postgres import PostgresOperator
+
+# Default arguments
+default_args = {
+    'owner': 'data-team',
+    'depends_on_past': False,
+    'start_date': datetime(2025, 6, 14, 7, 0),
+    'retries': 3,
+}
+
+# DAG definition: applies the pipeline schema once per deploy instead of on every run
+dag = DAG(
+    'init_schema',
+    default_args=default_args,
+    description='One-shot schema migration for csv_data_cleansing_pipeline',
+    schedule_interval='@once',
+    catchup=False,
+    # Airflow pauses new DAGs by default, which would leave the schema unapplied
+    is_paused_upon_creation=False,
+    tags=['data-engineering', 'schema'],
+)
+
+init_schema = PostgresOperator(
+    task_id='init_schema',
+    postgres_conn_id='postgres_data',
+    sql='sql/init_schema.sql',
+    pool='postgres_pool',
+    dag=dag,
+)
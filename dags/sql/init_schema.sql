@@ -0,0 +1,85 @@
+-- Schema for the csv_data_cleansing_pipeline DAG
+-- Applied once per deploy by the init_schema DAG, and by main.py when CREATE_TABLES=1;
+-- every statement is idempotent.
+
+-- Create data table for clean records
+CREATE TABLE IF NOT EXISTS data (
+    dates DATE,
+    ids VARCHAR(255) PRIMARY KEY,
+    names VARCHAR(255),
+    monthly_listeners BIGINT,
+    popularity INTEGER,
+    followers BIGINT,
+    genres TEXT,
+    first_release VARCHAR(4),
+    last_release VARCHAR(4),
+    num_releases INTEGER,
+    num_tracks INTEGER,
+    playlists_found VARCHAR(255),
+    feat_track_ids TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create data_reject table for duplicate records
+CREATE TABLE IF NOT EXISTS data_reject (
+    id SERIAL PRIMARY KEY,
+    dates DATE,
+    ids VARCHAR(255),
+    names VARCHAR(255),
+    monthly_listeners BIGINT,
+    popularity INTEGER,
+    followers BIGINT,
+    genres TEXT,
+    first_release VARCHAR(4),
+    last_release VARCHAR(4),
+    num_releases INTEGER,
+    num_tracks INTEGER,
+    playlists_found VARCHAR(255),
+    feat_track_ids TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS file_processing_log (
+    id SERIAL PRIMARY KEY,
+    file_hash VARCHAR(32) UNIQUE,
+    file_path VARCHAR(500),
+    mtime_ns BIGINT,
+    size_bytes BIGINT,
+    processing_status VARCHAR(50) DEFAULT 'processed',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Columns added after the first release, for databases created before them
+ALTER TABLE file_processing_log ADD COLUMN IF NOT EXISTS mtime_ns BIGINT;
+ALTER TABLE file_processing_log ADD COLUMN IF NOT EXISTS size_bytes BIGINT;
+
+CREATE TABLE IF NOT EXISTS error_log (
+    id SERIAL PRIMARY KEY,
+    dag_id VARCHAR(255),
+    execution_date TIMESTAMP,
+    task_id VARCHAR(255),
+    error_message TEXT,
+    log_url TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS pipeline_metrics (
+    id SERIAL PRIMARY KEY,
+    execution_date DATE,
+    total_records INTEGER,
+    clean_records INTEGER,
+    rejected_records INTEGER,
+    processing_time FLOAT,
+    file_size BIGINT,
+    memory_usage FLOAT,
+    success_rate FLOAT,
+    dag_run_id VARCHAR(255),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create indexes for better performance
+CREATE INDEX IF NOT EXISTS idx_data_dates ON data(dates);
+CREATE INDEX IF NOT EXISTS idx_data_names ON data(names);
+CREATE INDEX IF NOT EXISTS idx_data_reject_ids ON data_reject(ids);
+CREATE INDEX IF NOT EXISTS idx_data_reject_dates ON data_reject(dates);
+CREATE INDEX IF NOT EXISTS idx_file_processing_log_stat ON file_processing_log(file_path, mtime_ns, size_bytes);
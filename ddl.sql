@@ -48,6 +48,8 @@ CREATE TABLE IF NOT EXISTS file_processing_log (
     id SERIAL PRIMARY KEY,
     file_hash VARCHAR(32) UNIQUE,
     file_path VARCHAR(500),
+    mtime_ns BIGINT,
+    size_bytes BIGINT,
     processing_status VARCHAR(50) DEFAULT 'processed',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -81,6 +83,7 @@ CREATE INDEX IF NOT EXISTS idx_data_dates ON data(dates);
 CREATE INDEX IF NOT EXISTS idx_data_names ON data(names);
 CREATE INDEX IF NOT EXISTS idx_data_reject_ids ON data_reject(ids);
 CREATE INDEX IF NOT EXISTS idx_data_reject_dates ON data_reject(dates);
+CREATE INDEX IF NOT EXISTS idx_file_processing_log_stat ON file_processing_log(file_path, mtime_ns, size_bytes);
 
 -- Add comments to tables
 COMMENT ON TABLE data IS 'Table containing cleaned unique records';
@@ -1,14 +1,19 @@
-import subprocess
 import sys
+import ast
 import logging
 from datetime import datetime
+from functools import cached_property
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import pandas as pd
-import json
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+import orjson
 import os
-import ast
-import re
+import io
+from concurrent.futures import ThreadPoolExecutor
 
 # Setup logging
 logging.basicConfig(
@@ -21,49 +26,113 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Function to install sqlalchemy
-def install_sqlalchemy():
-    package = "sqlalchemy==2.0.29"
-    try:
-        logger.info(f"Attempting to install {package}")
-        subprocess.check_call([sys.executable, "-m", "pip", "install", package])
-        logger.info(f"Successfully installed {package}")
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Failed to install {package}: {str(e)}")
-        raise
+# Spotify track IDs are 22 alphanumeric characters
+TRACK_ID_PATTERN = r'^[a-zA-Z0-9]{22}$'
+
+# A genres value written as a Python list of quoted strings, e.g. ['pop', "rock 'n' roll"]
+QUOTED_ITEM_PATTERN = r"'(?:[^'\\]|\\.)*'" + r'|"(?:[^"\\]|\\.)*"'
+GENRE_LIST_PATTERN = rf'^\[\s*(?:(?:{QUOTED_ITEM_PATTERN})\s*(?:,\s*(?:{QUOTED_ITEM_PATTERN})\s*)*,?\s*)?\]$'
+# One quoted item of such a list, quotes included
+GENRE_ITEM_PATTERN = f'({QUOTED_ITEM_PATTERN})'
+
+# Date format used by the source CSV (e.g. 01/04/2024)
+SOURCE_DATE_FORMAT = '%d/%m/%Y'
+
+# Runs of non-ASCII characters, stripped with one vectorized regex replace instead of encode/decode
+NON_ASCII_PATTERN = r'[^\x00-\x7F]+'
+
+# Explicit column types for the source CSV so the parser skips type inference
+CSV_DTYPES = {
+    'dates': 'string[pyarrow]',
+    'ids': 'string[pyarrow]',
+    'names': 'string[pyarrow]',
+    'monthly_listeners': 'int64[pyarrow]',
+    'popularity': 'int16[pyarrow]',
+    'followers': 'int64[pyarrow]',
+    'genres': 'string[pyarrow]',
+    'first_release': 'string[pyarrow]',
+    'last_release': 'string[pyarrow]',
+    'num_releases': 'int32[pyarrow]',
+    'num_tracks': 'int32[pyarrow]',
+    'playlists_found': 'string[pyarrow]',
+    'feat_track_ids': 'string[pyarrow]'
+}
+
+# Low-cardinality string columns (genre lists, release years) held as categoricals after reading
+CATEGORY_COLUMNS = ['genres', 'first_release', 'last_release']
 
-# Install sqlalchemy before importing
-try:
-    install_sqlalchemy()
-except Exception as e:
-    logger.error(f"Dependency installation failed: {str(e)}")
-    sys.exit(1)
+# Output columns of the clean JSON file and the types they are written with
+JSON_COLUMNS = ['dates', 'ids', 'names', 'monthly_listeners', 'popularity', 'followers', 'genres',
+                'first_release', 'last_release', 'num_releases', 'num_tracks', 'playlists_found', 'feat_track_ids']
+INT_COLUMNS = ['monthly_listeners', 'popularity', 'followers', 'num_releases', 'num_tracks']
+STR_COLUMNS = ['ids', 'names', 'first_release', 'last_release', 'playlists_found']
+# Text written to the JSON file for a missing string value, as str(NaN) gave it before Arrow-backed columns
+MISSING_STR = 'nan'
 
-# Now import sqlalchemy after installation
-from sqlalchemy import create_engine
+# Fixed Arrow schema of the duplicate records backup, so every chunk of a streamed file matches
+BACKUP_SCHEMA = pa.schema([
+    ('dates', pa.timestamp('us')),
+    ('ids', pa.string()),
+    ('names', pa.string()),
+    ('monthly_listeners', pa.int64()),
+    ('popularity', pa.int16()),
+    ('followers', pa.int64()),
+    ('genres', pa.list_(pa.string())),
+    ('first_release', pa.string()),
+    ('last_release', pa.string()),
+    ('num_releases', pa.int32()),
+    ('num_tracks', pa.int32()),
+    ('playlists_found', pa.string()),
+    ('feat_track_ids', pa.list_(pa.string()))
+])
+# CSV has no list or date types: those columns are written as text
+BACKUP_CSV_SCHEMA = pa.schema([
+    pa.field(field.name, pa.string()) if field.name in ('dates', 'genres', 'feat_track_ids') else field
+    for field in BACKUP_SCHEMA
+])
+
+# Schema shared with the init_schema DAG, applied by create_tables only when asked to
+SCHEMA_SQL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dags', 'sql', 'init_schema.sql')
+
+# Directory the backup files are written to (the mounted target volume)
+TARGET_DIR = '/target'
+
+# Supported formats for the duplicate records backup file
+BACKUP_FORMATS = ('parquet', 'csv')
+
+# Records materialized per chunk while streaming the clean JSON file
+JSON_CHUNK_ROWS = 10000
+
+# Default rows per chunk when the source CSV is streamed instead of loaded at once
+CSV_CHUNK_ROWS = 500000
 
 class DataCleaner:
-    def __init__(self, db_config, execution_date_nodash):
+    def __init__(self, db_config, execution_date_nodash=None, backup_format='parquet'):
         """
         Initialize DataCleaner with database configuration
         
         Args:
             db_config (dict): Database configuration parameters
+            execution_date_nodash (str): Run timestamp (YYYYMMDDHHMMSS) used in output file names
+            backup_format (str): Format of the duplicate records backup, 'parquet' or 'csv'
         """
+        if backup_format not in BACKUP_FORMATS:
+            raise ValueError(f"Unsupported backup format '{backup_format}', expected one of {BACKUP_FORMATS}")
         self.db_config = db_config
-        self.engine = None
+        self.execution_date_nodash = execution_date_nodash
+        self.backup_format = backup_format
         self.connection = None
-        # self.test_datetime = datetime.now().strftime("%Y%m%d%H%M%S")
-        self.test_datetime = execution_date_nodash
+        self._dup_writer = None
+    
+    @cached_property
+    def test_datetime(self):
+        """Run timestamp for output file names, taken from the current time when none was given"""
+        return self.execution_date_nodash or datetime.now().strftime("%Y%m%d%H%M%S")
         
     def connect_db(self):
         """Establish database connection"""
         try:
-            # Create SQLAlchemy engine
-            db_url = f"postgresql://{self.db_config['user']}:{self.db_config['password']}@{self.db_config['host']}:{self.db_config['port']}/{self.db_config['database']}"
-            self.engine = create_engine(db_url)
-            
-            # Create direct connection for table creation
+            # One psycopg2 connection serves table creation and the COPY loads
             self.connection = psycopg2.connect(**self.db_config)
             # Set client encoding to UTF8
             self.connection.set_client_encoding('UTF8')
@@ -74,48 +143,13 @@ class DataCleaner:
             raise
     
     def create_tables(self):
-        """Create necessary tables in the database"""
+        """Apply the shared schema (dags/sql/init_schema.sql, also run by the init_schema DAG)"""
         try:
             cursor = self.connection.cursor()
             
-            # Create tables with proper data types
-            create_table_sql = """
-            -- Create data table for clean records
-            CREATE TABLE IF NOT EXISTS data (
-                dates DATE,
-                ids VARCHAR(255) PRIMARY KEY,
-                names VARCHAR(255),
-                monthly_listeners BIGINT,
-                popularity INTEGER,
-                followers BIGINT,
-                genres TEXT,
-                first_release VARCHAR(4),
-                last_release VARCHAR(4),
-                num_releases INTEGER,
-                num_tracks INTEGER,
-                playlists_found VARCHAR(255),
-                feat_track_ids TEXT
-            );
-            
-            -- Create data_reject table for duplicate records
-            CREATE TABLE IF NOT EXISTS data_reject (
-                dates DATE,
-                ids VARCHAR(255),
-                names VARCHAR(255),
-                monthly_listeners BIGINT,
-                popularity INTEGER,
-                followers BIGINT,
-                genres TEXT,
-                first_release VARCHAR(4),
-                last_release VARCHAR(4),
-                num_releases INTEGER,
-                num_tracks INTEGER,
-                playlists_found VARCHAR(255),
-                feat_track_ids TEXT
-            );
-            """
-            
-            cursor.execute(create_table_sql)
+            # Every statement in the schema file is idempotent, so it is safe on an existing database
+            with open(SCHEMA_SQL_PATH) as f:
+                cursor.execute(f.read())
             self.connection.commit()
             logger.info("Tables created successfully")
             
@@ -128,73 +162,196 @@ class DataCleaner:
     def read_csv(self, file_path):
         """Read CSV file and return DataFrame"""
         try:
-            # Try reading CSV with UTF-8 encoding
-            df = pd.read_csv(file_path, encoding='utf-8')
+            # Try reading CSV with UTF-8 encoding using the multi-threaded PyArrow parser
+            df = pd.read_csv(file_path, encoding='utf-8', engine='pyarrow', dtype=CSV_DTYPES, dtype_backend='pyarrow')
             logger.info(f"Successfully read CSV file: {file_path}")
             logger.info(f"Total rows in CSV: {len(df)}")
-            return df
+            return self._downcast(self._empty_strings_to_na(df))
+        except (pd.errors.ParserError, pa.ArrowInvalid) as pe:
+            # Older pandas (e.g. 2.0.x) lets the PyArrow parser's ArrowInvalid through unwrapped
+            logger.warning(f"PyArrow CSV parsing failed: {str(pe)}. Falling back to the pandas C parser.")
+            # Fallback: the C parser tolerates irregular input such as whitespace-only lines
+            df = pd.read_csv(file_path, encoding='utf-8', dtype=CSV_DTYPES, dtype_backend='pyarrow')
+            logger.info(f"Successfully read CSV file with fallback: {file_path}")
+            logger.info(f"Total rows in CSV: {len(df)}")
+            return self._downcast(df)
         except UnicodeDecodeError as ude:
             logger.warning(f"UTF-8 decoding failed: {str(ude)}. Falling back to reading with encoding error replacement.")
             # Fallback: Read file manually with error replacement
             with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                df = pd.read_csv(f)
+                df = pd.read_csv(f, dtype=CSV_DTYPES, dtype_backend='pyarrow')
             logger.info(f"Successfully read CSV file with fallback: {file_path}")
             logger.info(f"Total rows in CSV: {len(df)}")
-            return df
+            return self._downcast(df)
         except Exception as e:
             logger.error(f"Error reading CSV file: {str(e)}")
             raise
     
-    def parse_genres(self, x):
-        if pd.notna(x) and isinstance(x, str) and x.strip():
-            if x.startswith('[') and x.endswith(']'):
-                try:
-                    val = ast.literal_eval(x)
-                    if isinstance(val, list):
-                        return [str(item).strip().encode('ascii', errors='ignore').decode('ascii') for item in val]
-                except (SyntaxError, ValueError) as e:
-                    logger.warning(f"parse_genres(): Failed to eval '{x}' — falling back to split — error: {e}")
-            return [item.strip().encode('ascii', errors='ignore').decode('ascii') for item in x.split(',') if item.strip()]
-        return []
-    
-    def parse_track_ids(self, x):
-        if pd.notna(x) and isinstance(x, str) and x.strip():
-            id_pattern = re.compile(r'^[a-zA-Z0-9]{22}$')
-            items = [item.strip() for item in x.split(',')] if ',' in x else [x.strip()]
-            valid_items = []
-            invalid_items = []
-            
-            for item in items:
-                if item and id_pattern.match(item):
-                    valid_items.append(item.encode('ascii', errors='ignore').decode('ascii'))
-                else:
-                    invalid_items.append(item)
-            
-            if invalid_items:
-                logger.warning(f"Invalid track IDs found: {invalid_items[:5]} {'and more' if len(invalid_items) > 5 else ''}")
-            
-            return valid_items
-        return []
+    def read_parquet(self, file_path):
+        """Read a Parquet file whose genres/feat_track_ids are already list<string> columns"""
+        try:
+            df = pd.read_parquet(file_path, engine='pyarrow', dtype_backend='pyarrow')
+            logger.info(f"Successfully read Parquet file: {file_path}")
+            logger.info(f"Total rows in Parquet file: {len(df)}")
+            return self._downcast(df)
+        except Exception as e:
+            logger.error(f"Error reading Parquet file: {str(e)}")
+            raise
     
-    def clean_data(self, df):
+    def read_csv_chunks(self, file_path, chunksize=CSV_CHUNK_ROWS):
+        """Yield the CSV file as DataFrames of at most chunksize rows"""
         try:
-            df['dates'] = pd.to_datetime(df['dates'], dayfirst=True, errors='coerce').dt.strftime('%Y-%m-%d')
+            # The PyArrow engine has no chunked mode, so streaming uses the C parser. Chunks already
+            # yielded cannot be re-read, so invalid bytes are replaced up front as read_csv's fallback does
+            with pd.read_csv(file_path, encoding='utf-8', encoding_errors='replace', chunksize=chunksize,
+                             dtype=CSV_DTYPES, dtype_backend='pyarrow') as reader:
+                for chunk in reader:
+                    yield self._downcast(chunk)
+        except Exception as e:
+            logger.error(f"Error reading CSV file in chunks: {str(e)}")
+            raise
+    
+    @staticmethod
+    def _empty_strings_to_na(df):
+        """Turn empty string fields into NA, as the C parser reads them (pandas' PyArrow engine keeps '')"""
+        for column, dtype in CSV_DTYPES.items():
+            if dtype == 'string[pyarrow]' and column in df.columns:
+                df[column] = df[column].mask((df[column] == '').fillna(False))
+        return df
+    
+    @staticmethod
+    def _downcast(df):
+        """
+        Shrink the in-memory column types after reading
+        
+        Integer columns are narrowed to the smallest type that holds their values, and the
+        repetitive string columns become categoricals so they are stored and parsed once per distinct value
+        """
+        for column in INT_COLUMNS:
+            if column in df.columns:
+                df[column] = pd.to_numeric(df[column], downcast='integer')
+        for column in CATEGORY_COLUMNS:
+            if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype) \
+                    and not DataCleaner._is_list_column(df[column]):
+                df[column] = df[column].astype('category')
+        return df
+    
+    @staticmethod
+    def _is_list_column(series):
+        """True for Arrow list<...> columns, e.g. genres read from Parquet"""
+        return isinstance(series.dtype, pd.ArrowDtype) and pa.types.is_list(series.dtype.pyarrow_dtype)
+    
+    @staticmethod
+    def _list_values(series):
+        """Convert an Arrow list column to Python lists, with nulls as empty lists"""
+        return pd.Series([v if isinstance(v, list) else [] for v in series.tolist()], index=series.index, dtype=object)
+    
+    @staticmethod
+    def _duplicate_mask(ids, seen_ids=None):
+        """Mark every occurrence of an id after its first (keep='first'), hashing the ids once"""
+        codes, uniques = pd.factorize(ids, use_na_sentinel=False)
+        # Codes are numbered in order of first appearance, so a row is a first occurrence
+        # exactly when the running maximum of the codes steps up at that row
+        duplicate = np.diff(np.maximum.accumulate(codes), prepend=-1) == 0
+        if seen_ids is not None:
+            # Ids kept by earlier chunks: only the distinct ids of this chunk are looked up
+            unique_ids = uniques.tolist()
+            already_seen = np.fromiter((i in seen_ids for i in unique_ids), dtype=bool, count=len(unique_ids))
+            duplicate |= already_seen[codes]
+            seen_ids.update(i for i, seen in zip(unique_ids, already_seen) if not seen)
+        return duplicate
+    
+    @staticmethod
+    def _regroup(items, length):
+        """Collect exploded items (indexed by row position) back into one list per row"""
+        # A single pass over plain lists; groupby().agg(list) builds a Series per row
+        lists = [[] for _ in range(length)]
+        for pos, item in zip(items.index.tolist(), items.tolist()):
+            lists[pos].append(item)
+        return lists
+    
+    def parse_genres(self, series):
+        """Parse a genres column ("a, b" or "['a', 'b']") into lists of ASCII strings"""
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Parse each distinct genre string once and broadcast the lists through the codes
+            parsed = self.parse_genres(pd.Series(series.cat.categories)).tolist() + [[]]
+            lists = pd.Series(parsed, dtype=object).to_numpy()
+            return pd.Series(lists[series.cat.codes.to_numpy()], index=series.index, dtype=object)
+        s = series.astype('string').reset_index(drop=True)
+        s = s.str.replace(NON_ASCII_PATTERN, '', regex=True)
+        literal = s.str.match(GENRE_LIST_PATTERN).to_numpy(dtype=bool, na_value=False)
+        
+        # Python list literals: take every quoted item as literal_eval would, commas and empty items included
+        quoted = pd.Series(dtype='string')
+        if literal.any():
+            tokens = s[literal].str.extractall(GENRE_ITEM_PATTERN)[0].droplevel('match')
+            quoted = tokens.str.slice(1, -1).astype(object)
+            # Only the rare items with escapes need the Python parser
+            escaped = tokens.str.contains('\\', regex=False).to_numpy(dtype=bool, na_value=False)
+            if escaped.any():
+                quoted[escaped] = tokens[escaped].map(ast.literal_eval)
+            quoted = quoted.str.strip()
+        
+        # Anything else, malformed brackets included, is a plain comma separated list
+        items = s[~literal].str.split(',').explode().astype('string').str.strip()
+        items = items[items.notna() & (items != '')]
+        return pd.Series(self._regroup(pd.concat([quoted, items]), len(s)), index=series.index, dtype=object)
+    
+    def parse_track_ids(self, series):
+        """Parse a comma separated feat_track_ids column into lists of valid 22-char track IDs"""
+        s = series.astype('string').reset_index(drop=True)
+        non_empty = (s.str.strip() != '').fillna(False)
+        items = s[non_empty].str.split(',').explode().astype('string').str.strip()
+        valid = items.str.match(TRACK_ID_PATTERN).fillna(False)
+        
+        invalid_items = items[~valid].tolist()
+        if invalid_items:
+            logger.warning(f"Invalid track IDs found: {invalid_items[:5]} {'and more' if len(invalid_items) > 5 else ''}")
+        
+        return pd.Series(self._regroup(items[valid], len(s)), index=series.index, dtype=object)
+    
+    def clean_data(self, df, seen_ids=None):
+        """
+        Clean a DataFrame and split it into first occurrences and duplicates of each id
+        
+        The input frame is cleaned in place, so callers pass a frame they own (e.g. from read_csv).
+        
+        Args:
+            df (DataFrame): Raw records
+            seen_ids (set): Ids kept by earlier chunks of the same file; rows with these ids
+                are duplicates, and the ids kept here are added to it
+        """
+        try:
+            df = self._downcast(df)
+            
+            # Source dates are DD/MM/YYYY: an explicit format takes the vectorized parser,
+            # and only values in other formats go through the slower inferring parser
+            raw_dates = df['dates']
+            df['dates'] = pd.to_datetime(raw_dates, format=SOURCE_DATE_FORMAT, errors='coerce')
+            unparsed = df['dates'].isna() & raw_dates.notna()
+            if unparsed.any():
+                df.loc[unparsed, 'dates'] = pd.to_datetime(raw_dates[unparsed], dayfirst=True, errors='coerce')
             invalid_dates = df[df['dates'].isna()]
             if not invalid_dates.empty:
                 logger.warning(f"Found {len(invalid_dates)} rows with invalid dates: {invalid_dates[['ids', 'dates']].to_dict()}")
 
-            df['names'] = df['names'].str.upper().str.encode('ascii', errors='ignore').str.decode('ascii')
-            df['genres'] = df['genres'].apply(self.parse_genres)
-            df['feat_track_ids'] = df['feat_track_ids'].apply(self.parse_track_ids)
+            df['names'] = df['names'].str.upper().str.replace(NON_ASCII_PATTERN, '', regex=True)
+            # List columns from Parquet input are already parsed; only stringified lists need parsing
+            for column, parse in (('genres', self.parse_genres), ('feat_track_ids', self.parse_track_ids)):
+                if self._is_list_column(df[column]):
+                    df[column] = self._list_values(df[column])
+                else:
+                    df[column] = parse(df[column])
             
-            if df['playlists_found'].dtype in ['object', 'string']:
-                df['playlists_found'] = df['playlists_found'].str.encode('ascii', errors='ignore').str.decode('ascii')
+            if df['playlists_found'].dtype in ['object', 'string'] or pd.api.types.is_string_dtype(df['playlists_found'].dtype):
+                df['playlists_found'] = df['playlists_found'].str.replace(NON_ASCII_PATTERN, '', regex=True)
             else:
                 df['playlists_found'] = df['playlists_found'].astype(str)
             
-            duplicate_mask = df.duplicated(subset=['ids'], keep='first')
-            clean_data = df[~duplicate_mask].copy()
-            duplicate_data = df[duplicate_mask].copy()
+            duplicate_mask = self._duplicate_mask(df['ids'], seen_ids)
+            # Boolean indexing already returns new frames, so no extra copies are taken
+            clean_data = df.loc[~duplicate_mask]
+            duplicate_data = df.loc[duplicate_mask]
             
             logger.info(f"Clean records: {len(clean_data)}")
             logger.info(f"Duplicate records: {len(duplicate_data)}")
@@ -205,75 +362,208 @@ class DataCleaner:
             logger.error(f"Error cleaning data: {str(e)}")
             raise
     
-    def insert_to_database(self, clean_data, duplicate_data):
-        """Insert data to database tables"""
+    def clean_data_parallel(self, df, n_workers=None):
+        """
+        Clean a DataFrame on several threads, one shard of ids per thread
+        
+        Rows are sharded by a hash of their id, so every occurrence of an id lands in the same
+        shard and per-shard deduplication matches clean_data. Results keep the input row order.
+        
+        Not used by run_pipeline: the list regrouping in the parsers is pure Python and holds
+        the GIL, and no multi-core run has yet shown it beating clean_data.
+        """
+        n_workers = n_workers or os.cpu_count() or 1
+        # Downcast once so every shard shares the same categories and the results concatenate cleanly
+        df = self._downcast(df)
+        shard_of_row = pd.util.hash_pandas_object(df['ids'], index=False).to_numpy() % n_workers
+        # Shards are indexed by row position so the results can be put back in input order
+        positions = [np.flatnonzero(shard_of_row == shard) for shard in range(n_workers)]
+        shards = [df.take(rows).set_axis(rows) for rows in positions if len(rows)]
+        if len(shards) < 2:
+            # Nothing to spread across threads (e.g. a header-only file)
+            return self.clean_data(df)
+        if isinstance(df['genres'].dtype, pd.CategoricalDtype):
+            for shard in shards:
+                # parse_genres parses every category, so each shard keeps only the genres it holds;
+                # genres become lists, so their categories need not match across shards
+                shard['genres'] = shard['genres'].cat.remove_unused_categories()
+        
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            results = list(executor.map(self.clean_data, shards))
+        
+        clean_data, duplicate_data = (
+            pd.concat([result[i] for result in results]).sort_index() for i in (0, 1)
+        )
+        clean_data.index = df.index[clean_data.index]
+        duplicate_data.index = df.index[duplicate_data.index]
+        logger.info(f"Cleaned {len(df)} rows in {len(shards)} shards: {len(clean_data)} clean, {len(duplicate_data)} duplicate")
+        return clean_data, duplicate_data
+    
+    def clean_stream(self, file_path, chunksize=CSV_CHUNK_ROWS):
+        """
+        Read and clean the CSV file chunk by chunk, deduplicating ids across the whole file
+        
+        Duplicate rows are not kept in memory: each chunk's duplicates are appended to the
+        backup file and, when connected, copied into data_reject in the open transaction.
+        
+        Returns:
+            tuple: (clean records DataFrame, number of duplicate records)
+        """
+        seen_ids = set()
+        clean_chunks = []
+        duplicate_count = 0
+        # Opened up front so the backup file exists even when there are no duplicates
+        self._dup_writer = self.open_duplicate_writer()
         try:
-            # Prepare data for database insertion
-            clean_data_db = clean_data.copy()
-            duplicate_data_db = duplicate_data.copy()
-            
-            # Convert lists back to strings for database storage
-            clean_data_db['genres'] = clean_data_db['genres'].apply(lambda x: str(x))
-            clean_data_db['feat_track_ids'] = clean_data_db['feat_track_ids'].apply(lambda x: str(x))
-            duplicate_data_db['genres'] = duplicate_data_db['genres'].apply(lambda x: str(x))
-            duplicate_data_db['feat_track_ids'] = duplicate_data_db['feat_track_ids'].apply(lambda x: str(x))
-            
-            # Insert clean data
-            clean_data_db.to_sql('data', self.engine, if_exists='append', index=False)
-            logger.info(f"Inserted {len(clean_data_db)} clean records to 'data' table")
-            
-            # Insert duplicate data
-            duplicate_data_db.to_sql('data_reject', self.engine, if_exists='append', index=False)
-            logger.info(f"Inserted {len(duplicate_data_db)} duplicate records to 'data_reject' table")
+            for chunk in self.read_csv_chunks(file_path, chunksize):
+                clean_chunk, duplicate_chunk = self.clean_data(chunk, seen_ids)
+                clean_chunks.append(clean_chunk)
+                self._dup_writer.write_table(self._backup_table(duplicate_chunk))
+                if self.connection:
+                    self.copy_to_table(duplicate_chunk, 'data_reject')
+                duplicate_count += len(duplicate_chunk)
+        finally:
+            self.close_duplicate_writer()
+        
+        clean_data = pd.concat(clean_chunks)
+        logger.info(f"Streamed {len(clean_data) + duplicate_count} rows in {len(clean_chunks)} chunks of up to {chunksize}")
+        return clean_data, duplicate_count
+    
+    def insert_to_database(self, clean_data, duplicate_data=None):
+        """
+        Insert data to database tables
+        
+        Args:
+            clean_data (DataFrame): Records for the data table
+            duplicate_data (DataFrame): Records for data_reject, or None when clean_stream
+                already copied them in the open transaction
+        """
+        try:
+            # List columns need no conversion: to_csv in copy_to_table renders them with str()
+            # Bulk load both tables in one transaction
+            self.copy_to_table(clean_data, 'data')
+            if duplicate_data is not None:
+                self.copy_to_table(duplicate_data, 'data_reject')
+            self.connection.commit()
+            logger.info(f"Inserted {len(clean_data)} clean records to 'data' table")
+            if duplicate_data is not None:
+                logger.info(f"Inserted {len(duplicate_data)} duplicate records to 'data_reject' table")
             
         except Exception as e:
+            if self.connection:
+                self.connection.rollback()
             logger.error(f"Error inserting data to database: {str(e)}")
             raise
     
-    def create_backup_files(self, clean_data, duplicate_data):
-        """Create backup CSV and JSON files"""
+    def copy_to_table(self, frame, table):
+        """Stream a DataFrame into a table with a single COPY ... FROM STDIN (caller commits)"""
+        # Nullable integers keep whole numbers from being written as "5.0" when a column has gaps
+        float_int_columns = [col for col in INT_COLUMNS if col in frame.columns and pd.api.types.is_float_dtype(frame[col])]
+        if float_int_columns:
+            frame = frame.astype({col: 'Int64' for col in float_int_columns})
+        buffer = io.StringIO()
+        frame.to_csv(buffer, index=False, header=False, na_rep='\\N')
+        buffer.seek(0)
+        
+        cursor = self.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {table} ({', '.join(frame.columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                buffer
+            )
+        finally:
+            cursor.close()
+    
+    def _backup_table(self, frame):
+        """Convert duplicate records to an Arrow table with the backup schema of the configured format"""
+        if self.backup_format == 'parquet':
+            return pa.Table.from_pandas(frame, schema=BACKUP_SCHEMA, preserve_index=False)
+        # Arrow has no CSV form for lists or timestamps-as-dates, so render those columns as pandas would
+        text_frame = frame.astype({col: str for col in ('genres', 'feat_track_ids')})
+        if pd.api.types.is_datetime64_any_dtype(text_frame['dates']):
+            text_frame['dates'] = text_frame['dates'].dt.strftime('%Y-%m-%d')
+        return pa.Table.from_pandas(text_frame, schema=BACKUP_CSV_SCHEMA, preserve_index=False)
+    
+    def duplicate_backup_path(self):
+        """Path of the duplicate records backup for this run"""
+        return os.path.join(TARGET_DIR, f"data_reject_{self.test_datetime}.{self.backup_format}")
+    
+    def open_duplicate_writer(self):
+        """Open an Arrow writer that appends duplicate records to the backup file chunk by chunk"""
+        os.makedirs(TARGET_DIR, exist_ok=True)
+        duplicate_path = self.duplicate_backup_path()
+        logger.info(f"Streaming duplicate records to: {duplicate_path}")
+        if self.backup_format == 'parquet':
+            return pq.ParquetWriter(duplicate_path, BACKUP_SCHEMA, compression='snappy')
+        return pacsv.CSVWriter(duplicate_path, BACKUP_CSV_SCHEMA)
+    
+    def close_duplicate_writer(self):
+        """Close the streaming duplicate records writer, if one is open"""
+        if self._dup_writer is not None:
+            self._dup_writer.close()
+            self._dup_writer = None
+    
+    def write_csv(self, frame, path):
+        """Write duplicate records as CSV with Arrow's multi-threaded writer, falling back to pandas"""
+        try:
+            pacsv.write_csv(self._backup_table(frame), path)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError) as e:
+            logger.warning(f"Arrow CSV writer failed: {str(e)}. Falling back to pandas to_csv.")
+            frame.to_csv(path, index=False)
+    
+    def create_backup_files(self, clean_data, duplicate_data=None):
+        """
+        Create backup files: duplicate records as Parquet or CSV, clean records as JSON
+        
+        Args:
+            clean_data (DataFrame): Records for the JSON file
+            duplicate_data (DataFrame): Records for the duplicate backup, or None when
+                clean_stream already wrote them
+        """
         try:
             # Ensure target directory exists
-            target_dir = os.path.join('/target')  # Platform-independent path
-            os.makedirs(target_dir, exist_ok=True)
-            
-            # Create duplicate CSV file
-            duplicate_csv_path = os.path.join('/target', f"data_reject_{self.test_datetime}.csv")
-            duplicate_data_csv = duplicate_data.copy()
-            
-            # Convert lists back to string format for CSV
-            duplicate_data_csv['genres'] = duplicate_data_csv['genres'].apply(lambda x: str(x))
-            duplicate_data_csv['feat_track_ids'] = duplicate_data_csv['feat_track_ids'].apply(lambda x: str(x))
-            
-            duplicate_data_csv.to_csv(duplicate_csv_path, index=False)
-            logger.info(f"Created duplicate CSV file: {duplicate_csv_path}")
+            os.makedirs(TARGET_DIR, exist_ok=True)
+            
+            # Create duplicate backup file
+            duplicate_path = self.duplicate_backup_path()
+            if duplicate_data is None:
+                logger.info(f"Duplicate records were streamed to: {duplicate_path}")
+            elif self.backup_format == 'parquet':
+                # Columnar binary encoding skips per-cell text formatting; list columns stay list<string>
+                pq.write_table(self._backup_table(duplicate_data), duplicate_path, compression='snappy')
+                logger.info(f"Created duplicate Parquet file: {duplicate_path}")
+            elif duplicate_data.empty:
+                # Nothing to convert: write the header of an empty table with the same Arrow
+                # writer, so the file is quoted like every other CSV backup
+                pacsv.write_csv(BACKUP_CSV_SCHEMA.empty_table(), duplicate_path)
+                logger.info(f"No duplicates; created header-only CSV file: {duplicate_path}")
+            else:
+                self.write_csv(duplicate_data, duplicate_path)
+                logger.info(f"Created duplicate CSV file: {duplicate_path}")
             
             # Create clean JSON file
-            clean_json_path = os.path.join('/target', f"data_{self.test_datetime}.json")
-            json_data = {
-                "row_count": len(clean_data),
-                "data": []
-            }
-            
-            for _, row in clean_data.iterrows():
-                json_data["data"].append({
-                    "dates": row['dates'],
-                    "ids": str(row['ids']),
-                    "names": str(row['names']),
-                    "monthly_listeners": int(row['monthly_listeners']) if pd.notna(row['monthly_listeners']) else 0,
-                    "popularity": int(row['popularity']) if pd.notna(row['popularity']) else 0,
-                    "followers": int(row['followers']) if pd.notna(row['followers']) else 0,
-                    "genres": row['genres'],
-                    "first_release": str(row['first_release']),
-                    "last_release": str(row['last_release']),
-                    "num_releases": int(row['num_releases']) if pd.notna(row['num_releases']) else 0,
-                    "num_tracks": int(row['num_tracks']) if pd.notna(row['num_tracks']) else 0,
-                    "playlists_found": str(row['playlists_found']),
-                    "feat_track_ids": row['feat_track_ids']
-                })
-            
-            with open(clean_json_path, 'w') as f:
-                json.dump(json_data, f, indent=2)
+            clean_json_path = os.path.join(TARGET_DIR, f"data_{self.test_datetime}.json")
+            # Coerce column types once for the whole frame
+            # String columns go through object first: astype(str) renders Arrow NA as '<NA>'
+            json_frame = clean_data[JSON_COLUMNS].astype({col: object for col in STR_COLUMNS}).fillna(
+                {**{col: 0 for col in INT_COLUMNS}, **{col: MISSING_STR for col in STR_COLUMNS}}
+            ).astype({**{col: 'int64' for col in INT_COLUMNS}, **{col: str for col in STR_COLUMNS}})
+            # Dates stay datetime64 through cleaning and are only formatted for output
+            json_frame['dates'] = json_frame['dates'].dt.strftime('%Y-%m-%d')
+            
+            # Stream records chunk by chunk so only JSON_CHUNK_ROWS dicts are alive at a time;
+            # each record is indented to match orjson's OPT_INDENT_2 layout for the whole document
+            with open(clean_json_path, 'wb') as f:
+                f.write(b'{\n  "row_count": %d,\n  "data": [' % len(json_frame))
+                separator = b'\n    '
+                for start in range(0, len(json_frame), JSON_CHUNK_ROWS):
+                    records = json_frame.iloc[start:start + JSON_CHUNK_ROWS].to_dict(orient='records')
+                    f.write(separator + b',\n    '.join(
+                        orjson.dumps(record, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY).replace(b'\n', b'\n    ')
+                        for record in records
+                    ))
+                    separator = b',\n    '
+                f.write(b'\n  ]\n}' if len(json_frame) else b']\n}')
             
             logger.info(f"Created clean JSON file: {clean_json_path}")
             
@@ -286,13 +576,9 @@ class DataCleaner:
         try:
             cursor = self.connection.cursor()
             
-            # Get count from data table
-            cursor.execute("SELECT COUNT(*) FROM data")
-            clean_count = cursor.fetchone()[0]
-            
-            # Get count from data_reject table
-            cursor.execute("SELECT COUNT(*) FROM data_reject")
-            duplicate_count = cursor.fetchone()[0]
+            # Get counts from data and data_reject tables in one round trip
+            cursor.execute("SELECT (SELECT COUNT(*) FROM data), (SELECT COUNT(*) FROM data_reject)")
+            clean_count, duplicate_count = cursor.fetchone()
             
             logger.info(f"Total rows in 'data' table: {clean_count}")
             logger.info(f"Total rows in 'data_reject' table: {duplicate_count}")
@@ -307,30 +593,46 @@ class DataCleaner:
     def close_connections(self):
         """Close database connections"""
         try:
+            self.close_duplicate_writer()
             if self.connection:
                 self.connection.close()
-            if self.engine:
-                self.engine.dispose()
             logger.info("Database connections closed")
         except Exception as e:
             logger.error(f"Error closing connections: {str(e)}")
     
-    def run_pipeline(self, csv_path):
-        """Run the complete data cleansing pipeline"""
+    def run_pipeline(self, csv_path, chunksize=None, create_tables=False):
+        """
+        Run the complete data cleansing pipeline
+        
+        Args:
+            csv_path (str): Source CSV file, or a .parquet file with list<string> genres/feat_track_ids
+            chunksize (int): Stream the file in chunks of this many rows instead of loading it at once
+            create_tables (bool): Apply the schema first; the Airflow DAG leaves this to init_schema
+        """
         try:
             logger.info("Starting data cleansing pipeline...")
             
             # Connect to database
             self.connect_db()
             
-            # Create tables
-            self.create_tables()
-            
-            # Read CSV data
-            df = self.read_csv(csv_path)
-            
-            # Clean data
-            clean_data, duplicate_data = self.clean_data(df)
+            # Create tables (standalone runs only; scheduled runs skip the DDL round trip)
+            if create_tables:
+                self.create_tables()
+            
+            if csv_path.endswith('.parquet'):
+                # Parquet input arrives with typed list columns and skips the list parsing
+                clean_data, duplicate_data = self.clean_data(self.read_parquet(csv_path))
+            elif chunksize:
+                # Read and clean the CSV data one chunk at a time; duplicates go to data_reject
+                # and the backup file as each chunk is cleaned instead of being returned
+                clean_data, _ = self.clean_stream(csv_path, chunksize)
+                duplicate_data = None
+            else:
+                # Read CSV data
+                df = self.read_csv(csv_path)
+                
+                # Clean data
+                clean_data, duplicate_data = self.clean_data(df)
             
             # Insert to database
             self.insert_to_database(clean_data, duplicate_data)
@@ -352,23 +654,33 @@ class DataCleaner:
 def main():
     """Main function to run the data cleansing pipeline"""
     
-    # Database configuration
+    # Database configuration (defaults match docker-compose; DB_* env vars point at PgBouncer)
     db_config = {
-        'host': 'postgres',
-        'port': 5432,
-        'database': 'data_cleansing',
-        'user': 'postgres',
-        'password': 'password'
+        'host': os.environ.get('DB_HOST', 'postgres'),
+        'port': int(os.environ.get('DB_PORT', 5432)),
+        'database': os.environ.get('DB_NAME', 'data_cleansing'),
+        'user': os.environ.get('DB_USER', 'postgres'),
+        'password': os.environ.get('DB_PASSWORD', 'password')
     }
     
-    # CSV file path
-    csv_path = '/source/scrap.csv'
+    # Source file path (.csv, or .parquet with typed list columns)
+    csv_path = os.environ.get('SOURCE_PATH', '/source/scrap.csv')
+    
+    # Run timestamp for output file names; DataCleaner falls back to the current time
+    execution_date_nodash = os.environ.get('EXECUTION_DATE_NODASH')
+    
+    # Duplicate records backup format: 'parquet' (default) or 'csv' for legacy tooling
+    backup_format = os.environ.get('BACKUP_FORMAT', 'parquet')
+    
+    # Optional rows per chunk for sources too large to load at once
+    chunksize = int(os.environ.get('CSV_CHUNKSIZE', 0)) or None
     
-    execution_date_nodash = os.environ.get('EXECUTION_DATE_NODASH', datetime.now().strftime("%Y%m%d%H%M%S"))
+    # Apply the schema before loading, for the standalone data-cleaner service (CREATE_TABLES=1)
+    create_tables = os.environ.get('CREATE_TABLES', '0') == '1'
     
     # Create DataCleaner instance and run pipeline
-    cleaner = DataCleaner(db_config, execution_date_nodash)
-    cleaner.run_pipeline(csv_path)
+    cleaner = DataCleaner(db_config, execution_date_nodash, backup_format)
+    cleaner.run_pipeline(csv_path, chunksize, create_tables)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
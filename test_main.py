@@ -1,9 +1,13 @@
 import pytest
 import pandas as pd
-import os
 import json
 from unittest.mock import Mock, patch, MagicMock
-from main import DataCleaner
+from pandas.testing import assert_frame_equal
+from main import DataCleaner, CSV_DTYPES, SCHEMA_SQL_PATH
+
+# Expected ids/names of cleaning the sample_df fixture
+EXPECTED_CLEAN = pd.DataFrame({'ids': ['1', '2'], 'names': ['ARTIST ONE', 'ARTIST TWO']})
+EXPECTED_DUPLICATE = pd.DataFrame({'ids': ['1'], 'names': ['ARTIST ONE']})
 
 class TestDataCleaner:
     
@@ -18,25 +22,6 @@ class TestDataCleaner:
             'password': 'test_password'
         }
     
-    @pytest.fixture
-    def sample_df(self):
-        """Sample DataFrame for testing"""
-        return pd.DataFrame({
-            'dates': ['2024-01-01', '2024-01-02', '2024-01-01'],
-            'ids': ['1', '2', '1'],  # Note: duplicate id '1'
-            'names': ['artist one', 'artist two', 'artist one'],
-            'monthly_listeners': [1000000, 2000000, 1000000],
-            'popularity': [80, 90, 80],
-            'followers': [500000, 1000000, 500000],
-            'genres': ["['pop']", "['rock']", "['pop']"],
-            'first_release': ['2020', '2019', '2020'],
-            'last_release': ['2024', '2024', '2024'],
-            'num_releases': [5, 8, 5],
-            'num_tracks': [50, 80, 50],
-            'playlists_found': ['100', '200', '100'],
-            'feat_track_ids': ["['track1']", "['track2']", "['track1']"]
-        })
-    
     @pytest.fixture
     def data_cleaner(self, db_config):
         """Create DataCleaner instance for testing"""
@@ -45,49 +30,50 @@ class TestDataCleaner:
     def test_init(self, data_cleaner, db_config):
         """Test DataCleaner initialization"""
         assert data_cleaner.db_config == db_config
-        assert data_cleaner.engine is None
         assert data_cleaner.connection is None
         assert len(data_cleaner.test_datetime) == 14  # YYYYMMDDHHMMSS format
     
+    def test_init_execution_date(self, db_config):
+        """Test that an explicit execution date is used for output file names"""
+        assert DataCleaner(db_config, '20240101000000').test_datetime == '20240101000000'
+    
+    def test_init_invalid_backup_format(self, db_config):
+        """Test that unsupported backup formats are rejected"""
+        with pytest.raises(ValueError):
+            DataCleaner(db_config, '20240101000000', backup_format='xlsx')
+    
     @patch('main.pd.read_csv')
     def test_read_csv_success(self, mock_read_csv, data_cleaner, sample_df):
         """Test successful CSV reading"""
-        mock_read_csv.return_value = sample_df
-        
+        mock_read_csv.return_value = sample_df.copy()
+
         result = data_cleaner.read_csv('/test/path.csv')
-        
+
         assert isinstance(result, pd.DataFrame)
         assert len(result) == 3
-        mock_read_csv.assert_called_once_with('/test/path.csv')
+        mock_read_csv.assert_called_once_with(
+            '/test/path.csv', encoding='utf-8', engine='pyarrow', dtype=CSV_DTYPES, dtype_backend='pyarrow'
+        )
     
     @patch('main.pd.read_csv')
-    def test_read_csv_success(self, mock_read_csv, data_cleaner, sample_df):
-        """Test successful CSV reading"""
-        mock_read_csv.return_value = sample_df
+    def test_read_csv_downcasts_columns(self, mock_read_csv, data_cleaner, sample_df):
+        """Test that integer columns are narrowed and repetitive strings become categoricals"""
+        mock_read_csv.return_value = sample_df.copy()
 
         result = data_cleaner.read_csv('/test/path.csv')
 
-        assert isinstance(result, pd.DataFrame)
-        assert len(result) == 3
-        mock_read_csv.assert_called_once_with('/test/path.csv', encoding='utf-8')
-    
+        assert result['popularity'].dtype == 'int8'
+        assert result['monthly_listeners'].dtype == 'int32'
+        assert isinstance(result['genres'].dtype, pd.CategoricalDtype)
+        assert pd.api.types.is_string_dtype(result['playlists_found'])
+
     def test_clean_data(self, data_cleaner, sample_df):
         """Test data cleaning functionality"""
-        clean_data, duplicate_data = data_cleaner.clean_data(sample_df)
+        clean_data, duplicate_data = data_cleaner.clean_data(sample_df.copy())
         
-        # Should have 2 clean records and 1 duplicate
-        assert len(clean_data) == 2
-        assert len(duplicate_data) == 1
-        
-        # Check that names are uppercase
-        assert all(clean_data['names'].str.isupper())
-        assert all(duplicate_data['names'].str.isupper())
-        
-        # Check unique ids in clean data
-        assert len(clean_data['ids'].unique()) == len(clean_data)
-        
-        # Check that duplicate has the repeated id
-        assert duplicate_data.iloc[0]['ids'] == '1'
+        # First occurrence of each id is clean, the repeated id '1' is a duplicate; names are uppercased
+        assert_frame_equal(clean_data[['ids', 'names']].reset_index(drop=True), EXPECTED_CLEAN, check_dtype=False)
+        assert_frame_equal(duplicate_data[['ids', 'names']].reset_index(drop=True), EXPECTED_DUPLICATE, check_dtype=False)
     
     def test_clean_data_no_duplicates(self, data_cleaner):
         """Test cleaning data with no duplicates"""
@@ -112,42 +98,159 @@ class TestDataCleaner:
         assert len(clean_data) == 2
         assert len(duplicate_data) == 0
     
-    @patch('main.os.makedirs')
-    @patch('builtins.open', new_callable=MagicMock)
-    def test_create_backup_files(self, mock_open, mock_makedirs, data_cleaner, sample_df):
+    @pytest.mark.parametrize('raw, expected', [
+        ("['pop', 'dance pop']", ['pop', 'dance pop']),
+        ("['a,b', 'c']", ['a,b', 'c']),
+        ("['pop', '']", ['pop', '']),
+        ("['\\'q', \"rock 'n' roll\"]", ["'q", "rock 'n' roll"]),
+        ("[]", []),
+        ("[pop]", ['[pop]']),
+        ("pop, dance pop,,", ['pop', 'dance pop']),
+        ("['café', 'k-pop']", ['caf', 'k-pop']),
+        ("", []),
+        (None, []),
+    ])
+    def test_parse_genres(self, data_cleaner, raw, expected):
+        """Test genres parsing as list literals, comma separated text and missing values"""
+        series = pd.Series([raw, raw], dtype='string')
+        
+        assert data_cleaner.parse_genres(series).tolist() == [expected, expected]
+        assert data_cleaner.parse_genres(series.astype('category')).tolist() == [expected, expected]
+    
+    @pytest.mark.parametrize('raw, expected', [
+        ("0y0uzuB1HxljAY2j0tLETp", ['0y0uzuB1HxljAY2j0tLETp']),
+        ("0y0uzuB1HxljAY2j0tLETp, 1A2b3C4d5E6f7G8h9I0jKl", ['0y0uzuB1HxljAY2j0tLETp', '1A2b3C4d5E6f7G8h9I0jKl']),
+        ("0y0uzuB1HxljAY2j0tLETp,track1,", ['0y0uzuB1HxljAY2j0tLETp']),
+        ("['0y0uzuB1HxljAY2j0tLETp']", []),
+        ("0y0uzuB1HxljAY2j0tLET\u00e9", []),
+        ("  ", []),
+        (None, []),
+    ])
+    def test_parse_track_ids(self, data_cleaner, raw, expected):
+        """Test that only 22-character alphanumeric track IDs are kept"""
+        assert data_cleaner.parse_track_ids(pd.Series([raw], dtype='string')).tolist() == [expected]
+    
+    def test_create_backup_files(self, tmp_path, monkeypatch, data_cleaner, sample_df):
         """Test backup file creation"""
-        clean_data, duplicate_data = data_cleaner.clean_data(sample_df)
+        monkeypatch.setattr('main.TARGET_DIR', str(tmp_path))
+        clean_data, duplicate_data = data_cleaner.clean_data(sample_df.copy())
         
-        # Mock file operations
-        mock_file = MagicMock()
-        mock_open.return_value.__enter__.return_value = mock_file
+        data_cleaner.create_backup_files(clean_data, duplicate_data)
         
-        # Mock pandas to_csv
-        with patch.object(pd.DataFrame, 'to_csv') as mock_to_csv:
-            data_cleaner.create_backup_files(clean_data, duplicate_data)
-            
-            # Check that directories are created
-            mock_makedirs.assert_called_with(os.path.join('target'), exist_ok=True)
-            
-            # Check that CSV file is created
-            mock_to_csv.assert_called_once()
-            
-            # Check that JSON file is opened for writing
-            mock_open.assert_called()
+        # Duplicates are written as Parquet
+        reject = pd.read_parquet(tmp_path / f"data_reject_{data_cleaner.test_datetime}.parquet")
+        assert reject['ids'].tolist() == ['1']
+        
+        # Clean records are written as JSON
+        with open(tmp_path / f"data_{data_cleaner.test_datetime}.json") as f:
+            clean_json = json.load(f)
+        assert clean_json['row_count'] == 2
+        assert [record['names'] for record in clean_json['data']] == ['ARTIST ONE', 'ARTIST TWO']
+    
+    def test_create_backup_files_missing_release_year(self, tmp_path, monkeypatch, data_cleaner, sample_df):
+        """Test that a missing release year is written as 'nan' although the column is categorical"""
+        monkeypatch.setattr('main.TARGET_DIR', str(tmp_path))
+        df = sample_df.copy()
+        df.loc[1, 'first_release'] = None
+        csv_file = tmp_path / "missing_year.csv"
+        df.to_csv(csv_file, index=False)
+        clean_data, duplicate_data = data_cleaner.clean_data(data_cleaner.read_csv(str(csv_file)))
+        assert isinstance(clean_data['first_release'].dtype, pd.CategoricalDtype)
+        
+        data_cleaner.create_backup_files(clean_data, duplicate_data)
+        
+        with open(tmp_path / f"data_{data_cleaner.test_datetime}.json") as f:
+            records = json.load(f)['data']
+        assert [record['first_release'] for record in records] == ['2020', 'nan']
+    
+    def test_create_backup_files_csv(self, tmp_path, monkeypatch, data_cleaner, sample_df):
+        """Test that the CSV duplicate backup reads back with list columns rendered as text"""
+        monkeypatch.setattr('main.TARGET_DIR', str(tmp_path))
+        data_cleaner.backup_format = 'csv'
+        clean_data, duplicate_data = data_cleaner.clean_data(sample_df.copy())
+        
+        data_cleaner.create_backup_files(clean_data, duplicate_data)
+        
+        reject = pd.read_csv(tmp_path / f"data_reject_{data_cleaner.test_datetime}.csv", dtype=str)
+        assert list(reject.columns) == list(sample_df.columns)
+        assert reject.loc[0, 'ids'] == '1'
+        assert reject.loc[0, 'dates'] == '2024-01-01'
+        assert reject.loc[0, 'genres'] == "['pop']"
+    
+    def test_create_backup_files_no_duplicates(self, tmp_path, monkeypatch, data_cleaner, sample_df):
+        """Test that an empty duplicate set writes a header-only CSV quoted like the non-empty backup"""
+        monkeypatch.setattr('main.TARGET_DIR', str(tmp_path))
+        data_cleaner.backup_format = 'csv'
+        clean_data, duplicate_data = data_cleaner.clean_data(sample_df.drop_duplicates(subset=['ids']))
+        assert duplicate_data.empty
+        
+        data_cleaner.create_backup_files(clean_data, duplicate_data)
+        
+        header = (tmp_path / f"data_reject_{data_cleaner.test_datetime}.csv").read_text()
+        assert header == ','.join(f'"{column}"' for column in sample_df.columns) + '\n'
+    
+    def test_clean_data_parallel_matches_clean_data(self, data_cleaner, sample_df):
+        """Test that id-sharded cleaning gives the same split, in input order"""
+        clean_data, duplicate_data = data_cleaner.clean_data(sample_df.copy())
+        parallel_clean, parallel_duplicate = data_cleaner.clean_data_parallel(sample_df.copy(), n_workers=3)
+        
+        assert_frame_equal(parallel_clean, clean_data)
+        assert_frame_equal(parallel_duplicate, duplicate_data)
+    
+    def test_clean_data_parallel_empty(self, data_cleaner, sample_df):
+        """Test that a frame with no rows is cleaned like clean_data instead of sharded"""
+        clean_data, duplicate_data = data_cleaner.clean_data_parallel(sample_df.iloc[:0].copy(), n_workers=3)
+        
+        assert clean_data.empty
+        assert duplicate_data.empty
+        assert list(clean_data.columns) == list(sample_df.columns)
+    
+    def test_insert_to_database_uses_copy(self, data_cleaner, sample_df):
+        """Test that both tables are bulk loaded with COPY in one transaction"""
+        clean_data, duplicate_data = data_cleaner.clean_data(sample_df.copy())
+        data_cleaner.connection = MagicMock()
+        cursor = data_cleaner.connection.cursor.return_value
+        
+        data_cleaner.insert_to_database(clean_data, duplicate_data)
+        
+        assert cursor.copy_expert.call_count == 2
+        (clean_sql, clean_buffer), _ = cursor.copy_expert.call_args_list[0]
+        assert clean_sql.startswith('COPY data (dates, ids, names,')
+        assert len(clean_buffer.getvalue().splitlines()) == len(clean_data)
+        assert cursor.copy_expert.call_args_list[1][0][0].startswith('COPY data_reject (')
+        data_cleaner.connection.commit.assert_called_once()
     
     @patch('main.psycopg2.connect')
-    @patch('main.create_engine')
-    def test_connect_db_success(self, mock_create_engine, mock_connect, data_cleaner):
+    def test_connect_db_success(self, mock_connect, data_cleaner, db_config):
         """Test successful database connection"""
-        mock_engine = Mock()
         mock_connection = Mock()
-        mock_create_engine.return_value = mock_engine
         mock_connect.return_value = mock_connection
         
         data_cleaner.connect_db()
         
-        assert data_cleaner.engine == mock_engine
         assert data_cleaner.connection == mock_connection
+        mock_connect.assert_called_once_with(**db_config)
+        mock_connection.set_client_encoding.assert_called_once_with('UTF8')
+    
+    def test_create_tables_applies_shared_schema(self, data_cleaner):
+        """Test that create_tables runs the init_schema DAG's SQL file"""
+        data_cleaner.connection = MagicMock()
+        cursor = data_cleaner.connection.cursor.return_value
+        
+        data_cleaner.create_tables()
+        
+        with open(SCHEMA_SQL_PATH) as f:
+            cursor.execute.assert_called_once_with(f.read())
+        data_cleaner.connection.commit.assert_called_once()
+    
+    @pytest.mark.parametrize('create_tables', [False, True])
+    def test_run_pipeline_creates_tables_only_when_asked(self, data_cleaner, sample_df, create_tables):
+        """Test that scheduled runs skip the DDL and standalone runs apply it"""
+        with patch.multiple(data_cleaner, connect_db=Mock(), create_tables=Mock(), read_csv=Mock(return_value=sample_df.copy()),
+                            insert_to_database=Mock(), create_backup_files=Mock(), get_table_counts=Mock()):
+            data_cleaner.run_pipeline('/test/path.csv', create_tables=create_tables)
+            
+            assert data_cleaner.create_tables.called == create_tables
     
     @patch('main.psycopg2.connect')
     def test_connect_db_failure(self, mock_connect, data_cleaner):
@@ -161,37 +264,15 @@ class TestDataCleaner:
         """Test closing database connections"""
         # Mock connections
         mock_connection = Mock()
-        mock_engine = Mock()
         data_cleaner.connection = mock_connection
-        data_cleaner.engine = mock_engine
         
         data_cleaner.close_connections()
         
         mock_connection.close.assert_called_once()
-        mock_engine.dispose.assert_called_once()
 
 class TestDataCleanerIntegration:
     """Integration tests that require more setup"""
     
-    @pytest.fixture
-    def sample_df(self):
-        """Sample DataFrame for testing"""
-        return pd.DataFrame({
-            'dates': ['2024-01-01', '2024-01-02', '2024-01-01'],
-            'ids': ['1', '2', '1'],  # Note: duplicate id '1'
-            'names': ['artist one', 'artist two', 'artist one'],
-            'monthly_listeners': [1000000, 2000000, 1000000],
-            'popularity': [80, 90, 80],
-            'followers': [500000, 1000000, 500000],
-            'genres': ["['pop']", "['rock']", "['pop']"],
-            'first_release': ['2020', '2019', '2020'],
-            'last_release': ['2024', '2024', '2024'],
-            'num_releases': [5, 8, 5],
-            'num_tracks': [50, 80, 50],
-            'playlists_found': ['100', '200', '100'],  # Changed to strings
-            'feat_track_ids': ["['track1']", "['track2']", "['track1']"]
-        })
-
     @pytest.fixture
     def temp_csv_file(self, tmp_path):
         """Create a temporary CSV file for testing"""
@@ -225,5 +306,71 @@ class TestDataCleanerIntegration:
         assert len(clean_data) == 2
         assert len(duplicate_data) == 1
 
+    def test_clean_stream_deduplicates_across_chunks(self, temp_csv_file, tmp_path, monkeypatch):
+        """Duplicates split across chunks are still detected and streamed to the backup file"""
+        monkeypatch.setattr('main.TARGET_DIR', str(tmp_path))
+        cleaner = DataCleaner({}, '20240101000000')
+        
+        clean_data, duplicate_count = cleaner.clean_stream(temp_csv_file, chunksize=1)
+        assert list(clean_data['ids']) == ['1', '2']
+        assert duplicate_count == 1
+        
+        duplicate_data = pd.read_parquet(tmp_path / 'data_reject_20240101000000.parquet')
+        assert list(duplicate_data['ids']) == ['1']
+
+    def test_empty_fields_match_across_read_paths(self, tmp_path, monkeypatch):
+        """Empty fields are NA whether the file is read at once (PyArrow) or in chunks (C parser)"""
+        monkeypatch.setattr('main.TARGET_DIR', str(tmp_path))
+        csv_file = tmp_path / "empty_fields.csv"
+        csv_file.write_text(
+            "dates,ids,names,monthly_listeners,popularity,followers,genres,first_release,last_release,num_releases,num_tracks,playlists_found,feat_track_ids\n"
+            "01/01/2024,,artist one,1000000,80,500000,\"['pop']\",2020,2024,5,50,100,\n"
+            "02/01/2024,2,,2000000,90,1000000,,,2024,8,80,,0y0uzuB1HxljAY2j0tLETp\n"
+            "03/01/2024,3,artist three,,80,500000,pop,2020,,5,50,,\n"
+        )
+        cleaner = DataCleaner({}, '20240101000000')
+        
+        clean_data, _ = cleaner.clean_data(cleaner.read_csv(str(csv_file)))
+        stream_data, _ = cleaner.clean_stream(str(csv_file), chunksize=2)
+        
+        assert clean_data['ids'].isna().tolist() == [True, False, False]
+        assert clean_data['names'].isna().tolist() == [False, True, False]
+        assert_frame_equal(clean_data.reset_index(drop=True), stream_data.reset_index(drop=True),
+                           check_dtype=False, check_categorical=False)
+    
+    def test_clean_stream_json_matches_read_csv(self, tmp_path, monkeypatch):
+        """Chunked reading replaces invalid bytes and writes missing strings like the single read"""
+        monkeypatch.setattr('main.TARGET_DIR', str(tmp_path))
+        csv_file = tmp_path / "invalid_utf8.csv"
+        csv_file.write_bytes(
+            b"dates,ids,names,monthly_listeners,popularity,followers,genres,first_release,last_release,num_releases,num_tracks,playlists_found,feat_track_ids\n"
+            b"01/01/2024,1,caf\xe9,1000000,80,500000,pop,2020,2024,5,50,100,\n"
+            b"02/01/2024,2,,2000000,90,1000000,rock,2019,2024,8,80,,\n"
+        )
+        single, streamed = DataCleaner({}, '20240101000000'), DataCleaner({}, '20240101000001')
+        
+        single.create_backup_files(*single.clean_data(single.read_csv(str(csv_file))))
+        streamed.create_backup_files(streamed.clean_stream(str(csv_file), chunksize=1)[0])
+        
+        with open(tmp_path / "data_20240101000000.json") as f:
+            records = json.load(f)['data']
+        assert [record['names'] for record in records] == ['CAF', 'nan']
+        assert records[1]['playlists_found'] == 'nan'
+        assert (tmp_path / "data_20240101000001.json").read_text() == (tmp_path / "data_20240101000000.json").read_text()
+    
+    def test_read_parquet_list_columns(self, tmp_path, sample_df):
+        """Typed list columns from Parquet are used as-is instead of being parsed"""
+        df = sample_df.copy()
+        df['genres'] = [['pop', 'dance pop'], ['rock'], ['pop', 'dance pop']]
+        df['feat_track_ids'] = [['0y0uzuB1HxljAY2j0tLETp'], None, ['0y0uzuB1HxljAY2j0tLETp']]
+        parquet_file = tmp_path / "test.parquet"
+        df.to_parquet(parquet_file, index=False)
+        cleaner = DataCleaner({}, '20240101000000')
+        
+        clean_data, duplicate_data = cleaner.clean_data(cleaner.read_parquet(str(parquet_file)))
+        assert clean_data['genres'].tolist() == [['pop', 'dance pop'], ['rock']]
+        assert clean_data['feat_track_ids'].tolist() == [['0y0uzuB1HxljAY2j0tLETp'], []]
+        assert len(duplicate_data) == 1
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
\ No newline at end of file